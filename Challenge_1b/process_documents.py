@@ -1,18 +1,180 @@
 import os
-import json
+import orjson
 import re
+import hashlib
+import pickle
+import tempfile
 from pathlib import Path
 import fitz  # PyMuPDF
 from typing import List, Dict, Any, Tuple
+from concurrent.futures import ProcessPoolExecutor
 import logging
 from datetime import datetime
 from collections import Counter
 import math
 
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# PDF extraction workers (PyMuPDF scales best up to ~4 processes)
+MAX_EXTRACTION_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Collections this small, or already fully cached, are extracted serially in-process,
+# where process startup would outweigh the work
+MAX_SERIAL_EXTRACTION_DOCS = 3
+
+# Input and output locations mounted into the container
+INPUT_DIR = Path("/app/input")
+OUTPUT_DIR = Path("/app/output")
+
+# On-disk cache of extracted PDF text, keyed on path, mtime and size; kept under the
+# mounted output directory by default so it survives between container runs
+PDF_CACHE_DIR = Path(os.environ.get('PDF_CACHE_DIR', OUTPUT_DIR / '.pdf_cache'))
+PDF_CACHE_VERSION = 4  # Bump whenever the extracted data layout changes
+
+# Precompiled patterns used on the scoring hot path
+_HEADER_RE = re.compile(
+    r'(?:^\d+\.?\s+[A-Z])'  # Numbered sections
+    r'|(?:^[A-Z\s]{5,50}$)'  # All caps headers
+    r'|(?:^(?:Abstract|Introduction|Methodology|Results|Discussion|Conclusion|References))'
+    r'|(?:^(?:Chapter|Section|Part)\s+\d+)'
+    r'|(?:^[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s*$)',  # Title case
+    re.IGNORECASE
+)
+_WORD_RE = re.compile(r'\b\w+\b')
+_SENT_SPLIT_RE = re.compile(r'[.!?]+')
+
+def is_section_header(text: str) -> bool:
+    """Determine if text is likely a section header"""
+    text = text.strip()
+    
+    # Short text matching any of the header patterns
+    return 5 < len(text) < 200 and _HEADER_RE.match(text) is not None
+
+def sentence_windows(text: str, size: int) -> List[str]:
+    """Split text into sentences and join each run of `size` consecutive sentences"""
+    sentences = [s.strip() for s in _SENT_SPLIT_RE.split(text)]
+    return ['. '.join(filter(None, sentences[i:i + size])) for i in range(0, len(sentences), size)]
+
+def approximate_word_count(text: str) -> int:
+    """Approximate word count from separator counts, without building a word list"""
+    return text.count(' ') + text.count('\n') + 1
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores in descending order, ties kept in input order"""
+    n = len(scores)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+    
+    # Partial selection: everything above the k-th largest score, then ties in input order
+    threshold = np.partition(scores, n - k)[n - k]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:k - len(above)]
+    candidates = np.sort(np.concatenate([above, ties]))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+def pdf_cache_path(pdf_path: str) -> Path:
+    """Cache file for a PDF, invalidated when the file is modified"""
+    stat = os.stat(pdf_path)
+    key = f"{PDF_CACHE_VERSION}:{os.path.abspath(pdf_path)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return PDF_CACHE_DIR / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.pkl"
+
+def extract_document_text(pdf_path: str) -> Tuple[List[Dict], List[Dict]]:
+    """Extract text and sections from PDF, reusing a cached result from a previous run when available"""
+    cache_path = pdf_cache_path(pdf_path)
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.UnpicklingError, EOFError) as e:
+        logger.warning(f"Ignoring unreadable cache entry {cache_path}: {str(e)}")
+    
+    result = parse_document_text(pdf_path)
+    
+    # Write to a uniquely named temporary file first so concurrent workers never see partial entries
+    tmp_path = None
+    try:
+        PDF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=PDF_CACHE_DIR, prefix=f"{cache_path.stem}.",
+                                         suffix='.tmp', delete=False) as f:
+            tmp_path = f.name
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not cache extracted text for {pdf_path}: {str(e)}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    return result
+
+def parse_document_text(pdf_path: str) -> Tuple[List[Dict], List[Dict]]:
+    """Extract text from PDF with page information, grouping paragraphs into sections as they are read"""
+    doc = fitz.open(pdf_path)
+    document_data = []
+    sections = []
+    current_section = None
+    doc_name = os.path.basename(pdf_path)
+    
+    for page_num in range(len(doc)):
+        page = doc.load_page(page_num)
+        page_label = page_num + 1
+        
+        # PyMuPDF segments the page into text blocks (x0, y0, x1, y1, text, block_no, block_type)
+        for block_idx, (_, _, _, _, block_text, _, block_type) in enumerate(page.get_text("blocks")):
+            paragraph = block_text.strip()
+            if block_type != 0 or len(paragraph) <= 50:  # Text blocks only, skip very short ones
+                continue
+            
+            item = {
+                'document': doc_name,
+                'page': page_label,
+                'section_id': f"p{page_label}_{block_idx}",
+                'text': paragraph,
+                'word_count': approximate_word_count(paragraph)
+            }
+            document_data.append(item)
+            
+            # Check if this looks like a section header
+            if is_section_header(paragraph):
+                # If we have a current section, save it
+                if current_section:
+                    sections.append(current_section)
+                
+                # Start new section
+                current_section = {
+                    'document': item['document'],
+                    'page': item['page'],
+                    'section_title': paragraph[:100] + "..." if len(paragraph) > 100 else paragraph,
+                    'content': [item],
+                    'importance_rank': 0
+                }
+            elif current_section:
+                # Add to current section
+                current_section['content'].append(item)
+            else:
+                # Create a section for orphaned content
+                current_section = {
+                    'document': item['document'],
+                    'page': item['page'],
+                    'section_title': f"Section starting at page {item['page']}",
+                    'content': [item],
+                    'importance_rank': 0
+                }
+    
+    # Don't forget the last section
+    if current_section:
+        sections.append(current_section)
+    
+    doc.close()
+    return document_data, sections
+
 class PersonaDocumentAnalyzer:
     def __init__(self):
         # Keywords for different personas and their typical focus areas
@@ -25,215 +187,187 @@ class PersonaDocumentAnalyzer:
             'consultant': ['recommendation', 'solution', 'best practice', 'assessment', 'evaluation', 'improvement', 'process', 'efficiency', 'optimization'],
         }
         
+        # Persona descriptions are mapped to the first type with a matching keyword
+        self.persona_mappings = {
+            'researcher': ['researcher', 'scientist', 'phd', 'academic'],
+            'student': ['student', 'undergraduate', 'graduate', 'learner'],
+            'analyst': ['analyst', 'investment', 'financial', 'business analyst'],
+            'manager': ['manager', 'director', 'executive', 'leader'],
+            'developer': ['developer', 'engineer', 'programmer', 'technical'],
+            'consultant': ['consultant', 'advisor', 'specialist']
+        }
+        
+        # Single regex over all mappings: alternatives are tried in mapping order, each
+        # looking ahead through the whole persona, so earlier types still take priority
+        self._persona_re = re.compile(
+            '|'.join(
+                f"(?=.*?(?:{'|'.join(map(re.escape, keywords))}))(?P<{persona_type}>)"
+                for persona_type, keywords in self.persona_mappings.items()
+            ),
+            re.IGNORECASE | re.DOTALL
+        )
+        
         # Academic keywords for research contexts
         self.academic_keywords = ['abstract', 'introduction', 'methodology', 'results', 'discussion', 'conclusion', 'references', 'literature review']
         
         # Business keywords for business contexts
         self.business_keywords = ['executive summary', 'financial', 'revenue', 'profit', 'market', 'strategy', 'competitive', 'analysis']
-
-    def extract_document_text(self, pdf_path: str) -> List[Dict]:
-        """Extract text from PDF with page and section information"""
-        doc = fitz.open(pdf_path)
-        document_data = []
         
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text()
-            
-            # Split text into paragraphs/sections
-            paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-            
-            for para_idx, paragraph in enumerate(paragraphs):
-                if len(paragraph) > 50:  # Filter out very short paragraphs
-                    document_data.append({
-                        'document': Path(pdf_path).name,
-                        'page': page_num + 1,
-                        'section_id': f"p{page_num + 1}_{para_idx}",
-                        'text': paragraph,
-                        'word_count': len(paragraph.split())
-                    })
+        # Every keyword any scoring component may look for, as a fixed vocabulary
+        self._all_keywords = sorted(
+            {keyword for keywords in self.persona_keywords.values() for keyword in keywords}
+            | set(self.academic_keywords) | set(self.business_keywords)
+        )
         
-        doc.close()
-        return document_data
-
-    def identify_sections(self, document_data: List[Dict]) -> List[Dict]:
-        """Identify major sections in the document"""
-        sections = []
-        current_section = None
+        # The few multi-word keywords are matched directly instead of generating every bigram
+        self._multiword_re = re.compile(r'\b(?:' + '|'.join(
+            r'\s+'.join(map(re.escape, keyword.split()))
+            for keyword in self._all_keywords if ' ' in keyword
+        ) + r')\b')
         
-        for item in document_data:
-            text = item['text']
-            
-            # Check if this looks like a section header
-            if self.is_section_header(text):
-                # If we have a current section, save it
-                if current_section:
-                    sections.append(current_section)
-                
-                # Start new section
-                current_section = {
-                    'document': item['document'],
-                    'page': item['page'],
-                    'section_title': text[:100] + "..." if len(text) > 100 else text,
-                    'content': [item],
-                    'importance_rank': 0
-                }
-            else:
-                # Add to current section
-                if current_section:
-                    current_section['content'].append(item)
-                else:
-                    # Create a section for orphaned content
-                    current_section = {
-                        'document': item['document'],
-                        'page': item['page'],
-                        'section_title': f"Section starting at page {item['page']}",
-                        'content': [item],
-                        'importance_rank': 0
-                    }
-        
-        # Don't forget the last section
-        if current_section:
-            sections.append(current_section)
-        
-        return sections
+        # Per-collection scoring context, set by process_document_collection
+        self._ctx: Dict[str, Any] = {}
+
+    def extract_document_text(self, pdf_path: str) -> Tuple[List[Dict], List[Dict]]:
+        """Extract text and sections from PDF with page information"""
+        return extract_document_text(pdf_path)
 
     def is_section_header(self, text: str) -> bool:
         """Determine if text is likely a section header"""
-        text = text.strip()
-        
-        # Short text that might be a header
-        if len(text) < 200 and len(text) > 5:
-            # Check for header patterns
-            header_patterns = [
-                r'^\d+\.?\s+[A-Z]',  # Numbered sections
-                r'^[A-Z\s]{5,50}$',  # All caps headers
-                r'^(Abstract|Introduction|Methodology|Results|Discussion|Conclusion|References)',
-                r'^(Chapter|Section|Part)\s+\d+',
-                r'^[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s*$'  # Title case
-            ]
-            
-            for pattern in header_patterns:
-                if re.match(pattern, text, re.IGNORECASE):
-                    return True
-        
-        return False
+        return is_section_header(text)
 
-    def calculate_relevance_score(self, text: str, persona: str, job_description: str) -> float:
-        """Calculate relevance score based on persona and job requirements"""
-        text_lower = text.lower()
-        persona_lower = persona.lower()
+    def analyze_keywords(self, text: str) -> List[str]:
+        """Word unigrams plus any multi-word keywords whose words are separated only by whitespace"""
+        terms = _WORD_RE.findall(text)
+        terms.extend(' '.join(match.split()) for match in self._multiword_re.findall(text))
+        return terms
+
+    def build_scoring_context(self, persona: str, job_description: str) -> Dict[str, Any]:
+        """Precompute persona and job features shared by every score in a collection"""
         job_lower = job_description.lower()
+        persona_type = self.identify_persona_type(persona.lower())
+        job_words = set(_WORD_RE.findall(job_lower))
+        persona_words = self.persona_keywords.get(persona_type, [])
         
-        score = 0.0
+        # One vocabulary covering the job words and all keyword families, including
+        # multi-word keywords such as 'best practice'
+        vocabulary = sorted(job_words | set(self._all_keywords))
+        index = {term: i for i, term in enumerate(vocabulary)}
         
-        # 1. Direct keyword matching with job description
-        job_words = set(re.findall(r'\b\w+\b', job_lower))
-        text_words = set(re.findall(r'\b\w+\b', text_lower))
+        # Each component's weight is folded into a single vector so scoring is one matvec
+        weights = np.zeros(len(vocabulary), dtype=np.float32)
         
-        # Calculate keyword overlap
-        common_words = job_words.intersection(text_words)
-        if job_words:
-            keyword_score = len(common_words) / len(job_words)
-            score += keyword_score * 40  # 40% weight for direct keyword matching
+        # 1. Direct keyword matching with job description (40% weight)
+        for word in job_words:
+            weights[index[word]] += 40 / len(job_words)
         
-        # 2. Persona-specific keyword matching
-        persona_type = self.identify_persona_type(persona_lower)
-        if persona_type in self.persona_keywords:
-            persona_words = self.persona_keywords[persona_type]
-            persona_matches = sum(1 for word in persona_words if word in text_lower)
-            if persona_words:
-                persona_score = persona_matches / len(persona_words)
-                score += persona_score * 30  # 30% weight for persona relevance
+        # 2. Persona-specific keyword matching (30% weight)
+        for word in persona_words:
+            weights[index[word]] += 30 / len(persona_words)
         
         # 3. Academic vs Business context scoring
         if any(keyword in job_lower for keyword in ['research', 'study', 'academic', 'paper']):
-            academic_matches = sum(1 for keyword in self.academic_keywords if keyword in text_lower)
-            score += academic_matches * 5
+            for keyword in self.academic_keywords:
+                weights[index[keyword]] += 5
         
         if any(keyword in job_lower for keyword in ['business', 'financial', 'market', 'revenue']):
-            business_matches = sum(1 for keyword in self.business_keywords if keyword in text_lower)
-            score += business_matches * 5
+            for keyword in self.business_keywords:
+                weights[index[keyword]] += 5
+        
+        return {
+            'vectorizer': CountVectorizer(
+                analyzer=self.analyze_keywords, vocabulary=vocabulary, binary=True, dtype=np.uint16
+            ),
+            'weights': weights,
+        }
+
+    def score_texts(self, texts: List[str]) -> np.ndarray:
+        """Calculate relevance scores for a batch of texts in one vectorized pass"""
+        ctx = self._ctx
+        if not texts:
+            return np.zeros(0, dtype=np.float32)
+        
+        texts_lower = [text.lower() for text in texts]
+        
+        # 1-3. Job, persona and context keyword matching as one sparse matrix-vector product
+        presence = ctx['vectorizer'].transform(texts_lower)
+        scores = presence @ ctx['weights']
         
         # 4. Text length bonus (longer sections often contain more information)
-        word_count = len(text.split())
-        if word_count > 100:
-            score += min(word_count / 100, 10)  # Max 10 points for length
+        word_counts = np.array([approximate_word_count(text) for text in texts], dtype=np.float32)
+        scores += np.where(word_counts > 100, np.minimum(word_counts / 100, 10), 0)  # Max 10 points for length
         
         # 5. Section position bonus (earlier sections often more important)
         # This would be calculated at the section level
         
-        return min(score, 100)  # Cap at 100
+        return np.minimum(scores, 100)  # Cap at 100
 
     def identify_persona_type(self, persona: str) -> str:
         """Identify the general type of persona"""
-        persona_mappings = {
-            'researcher': ['researcher', 'scientist', 'phd', 'academic'],
-            'student': ['student', 'undergraduate', 'graduate', 'learner'],
-            'analyst': ['analyst', 'investment', 'financial', 'business analyst'],
-            'manager': ['manager', 'director', 'executive', 'leader'],
-            'developer': ['developer', 'engineer', 'programmer', 'technical'],
-            'consultant': ['consultant', 'advisor', 'specialist']
-        }
-        
-        for persona_type, keywords in persona_mappings.items():
-            if any(keyword in persona for keyword in keywords):
-                return persona_type
-        
-        return 'general'
+        match = self._persona_re.match(persona)
+        return match.lastgroup if match else 'general'
 
-    def extract_subsections(self, section: Dict, persona: str, job_description: str) -> List[Dict]:
-        """Extract and rank subsections from a major section"""
+    def build_subsections(self, section: Dict) -> List[Dict]:
+        """Split a section into unscored subsections"""
         subsections = []
         
         for item in section['content']:
-            # Split long paragraphs into smaller subsections
-            text = item['text']
-            sentences = re.split(r'[.!?]+', text)
-            
-            # Group sentences into subsections (3-5 sentences each)
+            # Split long paragraphs into smaller subsections (3-5 sentences each)
             subsection_size = 4
-            for i in range(0, len(sentences), subsection_size):
-                subsection_sentences = sentences[i:i+subsection_size]
-                subsection_text = '. '.join(s.strip() for s in subsection_sentences if s.strip())
-                
+            for subsection_text in sentence_windows(item['text'], subsection_size):
                 if len(subsection_text) > 50:  # Filter very short subsections
-                    relevance_score = self.calculate_relevance_score(subsection_text, persona, job_description)
-                    
                     subsections.append({
                         'document': item['document'],
                         'page_number': item['page'],
                         'refined_text': subsection_text,
-                        'relevance_score': relevance_score
+                        'relevance_score': 0.0
                     })
         
-        # Sort by relevance score
-        subsections.sort(key=lambda x: x['relevance_score'], reverse=True)
+        return subsections
+
+    def extract_subsections(self, section: Dict) -> List[Dict]:
+        """Extract the top ranked subsections from a scored section"""
+        subsections = section['subsections']
         
-        return subsections[:10]  # Return top 10 subsections
+        # Select the top 10 subsections by relevance score
+        scores = np.array([subsection['relevance_score'] for subsection in subsections], dtype=np.float32)
+        return [subsections[i] for i in top_k_indices(scores, 10)]
 
-    def rank_sections(self, sections: List[Dict], persona: str, job_description: str) -> List[Dict]:
-        """Rank sections based on relevance to persona and job"""
+    def rank_sections(self, sections: List[Dict], top_k: int = 20) -> List[Dict]:
+        """Rank sections based on relevance to persona and job, keeping the top_k"""
+        # Score every subsection in one batch; the finer granularity is enough to rank
+        # sections too, so a section scores as its best subsection
+        all_subsections = []
         for section in sections:
-            # Calculate section relevance score
-            section_text = ' '.join([item['text'] for item in section['content']])
-            section['relevance_score'] = self.calculate_relevance_score(section_text, persona, job_description)
+            section['subsections'] = self.build_subsections(section)
+            all_subsections.extend(section['subsections'])
         
-        # Sort sections by relevance score
-        sections.sort(key=lambda x: x['relevance_score'], reverse=True)
+        subsection_scores = self.score_texts([subsection['refined_text'] for subsection in all_subsections])
+        # Scores are float32, so only report the digits that precision supports
+        for subsection, score in zip(all_subsections, subsection_scores):
+            subsection['relevance_score'] = round(float(score), 4)
+        
+        scores = np.array([
+            max((subsection['relevance_score'] for subsection in section['subsections']), default=0.0)
+            for section in sections
+        ], dtype=np.float32)
+        for section, score in zip(sections, scores):
+            section['relevance_score'] = float(score)
+        
+        # Select the top sections by relevance score
+        ranked_sections = [sections[i] for i in top_k_indices(scores, top_k)]
         
         # Assign importance ranks
-        for i, section in enumerate(sections):
+        for i, section in enumerate(ranked_sections):
             section['importance_rank'] = i + 1
         
-        return sections
+        return ranked_sections
 
     def process_document_collection(self, input_file: str) -> Dict[str, Any]:
         """Process a collection of documents based on input configuration"""
         try:
             # Read input configuration
-            with open(input_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
+            config = orjson.loads(Path(input_file).read_bytes())
             
             collection_path = Path(input_file).parent
             persona = config['persona']
@@ -243,25 +377,36 @@ class PersonaDocumentAnalyzer:
             logger.info(f"Processing collection for persona: {persona}")
             logger.info(f"Job: {job_description}")
             
+            # Persona and job features are identical for every section in the collection
+            self._ctx = self.build_scoring_context(persona, job_description)
+            
             # Extract text from all documents
-            all_document_data = []
+            pdf_paths = []
             for doc_name in documents:
                 doc_path = collection_path / 'PDFs' / doc_name
                 if doc_path.exists():
                     logger.info(f"Processing document: {doc_name}")
-                    doc_data = self.extract_document_text(str(doc_path))
-                    all_document_data.extend(doc_data)
+                    pdf_paths.append(str(doc_path))
                 else:
                     logger.warning(f"Document not found: {doc_path}")
             
-            # Identify sections across all documents
-            all_sections = self.identify_sections(all_document_data)
-            
-            # Rank sections based on relevance
-            ranked_sections = self.rank_sections(all_sections, persona, job_description)
+            # Small or fully cached collections are extracted serially; otherwise only path
+            # strings cross the process boundary and each worker opens its own PDF, returning
+            # the sections it identified while extracting
+            all_sections = []
+            if pdf_paths:
+                if (len(pdf_paths) <= MAX_SERIAL_EXTRACTION_DOCS
+                        or all(pdf_cache_path(path).exists() for path in pdf_paths)):
+                    results = [self.extract_document_text(path) for path in pdf_paths]
+                else:
+                    with ProcessPoolExecutor(max_workers=MAX_EXTRACTION_WORKERS) as executor:
+                        results = list(executor.map(extract_document_text, pdf_paths))
+                
+                for _, doc_sections in results:
+                    all_sections.extend(doc_sections)
             
-            # Extract top sections for output
-            top_sections = ranked_sections[:20]  # Top 20 sections
+            # Rank sections based on relevance, keeping the top 20 for output
+            top_sections = self.rank_sections(all_sections, top_k=20)
             
             extracted_sections = []
             sub_section_analysis = []
@@ -276,7 +421,7 @@ class PersonaDocumentAnalyzer:
                 
                 # Extract subsections from top 10 sections
                 if section['importance_rank'] <= 10:
-                    subsections = self.extract_subsections(section, persona, job_description)
+                    subsections = self.extract_subsections(section)
                     sub_section_analysis.extend(subsections[:3])  # Top 3 subsections per section
             
             # Create output
@@ -309,8 +454,8 @@ class PersonaDocumentAnalyzer:
 
 def process_collections():
     """Main function to process all document collections"""
-    input_dir = Path("/app/input")
-    output_dir = Path("/app/output")
+    input_dir = INPUT_DIR
+    output_dir = OUTPUT_DIR
     
     # Create output directory if it doesn't exist
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -336,9 +481,8 @@ def process_collections():
             output_filename = f"{collection_name}_output.json"
             output_path = output_dir / output_filename
             
-            # Save JSON output
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
+            # Save JSON output (orjson writes UTF-8 directly, matching ensure_ascii=False)
+            output_path.write_bytes(orjson.dumps(result, option=orjson.OPT_INDENT_2))
             
             logger.info(f"Generated {output_filename}")
             